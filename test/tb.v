@@ -7,9 +7,13 @@
 
 module tb ();
 
-  // Dump the signals to a VCD file. You can view it with gtkwave or surfer.
+  // Dump the signals to a VCD file (FST with Verilator). You can view it with gtkwave or surfer.
   initial begin
+`ifdef VERILATOR
+    $dumpfile("tb.fst");
+`else
     $dumpfile("tb.vcd");
+`endif
     $dumpvars(0, tb);
     #1;
   end
@@ -24,6 +28,18 @@ module tb ();
   wire [7:0] uio_out;
   wire [7:0] uio_oe;
 
+  // Optional clock generator, enabled with the +cocotb_clkgen plusarg. The
+  // clock then toggles inside the simulator instead of from a cocotb Clock;
+  // test.py only sets clk_half_period (in ns) to pick the frequency.
+  integer clk_half_period = 5000;
+
+  initial begin
+    if ($test$plusargs("cocotb_clkgen")) begin
+      clk = 1'b0;
+      forever #(clk_half_period) clk = ~clk;
+    end
+  end
+
 `ifdef GL_TEST
   wire VPWR = 1'b1;
   wire VGND = 1'b0;
@@ -48,4 +64,9 @@ module tb ();
       .rst_n  (rst_n)     // not reset
   );
 
+  // Individual uo_out bits, so the tests can wait on them directly:
+  wire led = uo_out[0];
+  wire timing_tick = uo_out[1];
+  wire new_number_pulse = uo_out[3];
+
 endmodule
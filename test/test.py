@@ -1,9 +1,104 @@
 # SPDX-FileCopyrightText: © 2024 Tiny Tapeout
 # SPDX-License-Identifier: Apache-2.0
 
+import logging
+import os
+
 import cocotb
 from cocotb.clock import Clock
-from cocotb.triggers import ClockCycles, Timer, RisingEdge, FallingEdge
+from cocotb.result import SimTimeoutError
+from cocotb.triggers import ClockCycles, Timer, RisingEdge, FallingEdge, Edge, with_timeout
+from cocotb.utils import get_sim_steps, get_sim_time
+
+from testcases import SEQUENCES, SPEEDS, sequence_test_name, speed_test_name
+
+# Keep the testbench's own messages (dut._log, logger "cocotb.tb") down to warnings
+# in CI; cocotb's per-test results and summary are still logged
+if os.environ.get("CI"):
+    logging.getLogger("cocotb.tb").setLevel(logging.WARNING)
+
+# ui_in values with the output enabled (bit 6), indexed by (speed, sequence select)
+UI_IN_ENABLED = {(speed, seq): 0x40 | (speed << 2) | seq for speed in range(8) for seq in range(4)}
+
+def add_test(name, check, *args):
+    """Register a cocotb test called name that runs check(dut, *args)."""
+    async def run(dut):
+        await check(dut, *args)
+    
+    run.__name__ = run.__qualname__ = name
+    run.__doc__ = check.__doc__
+    globals()[name] = cocotb.test()(run)
+
+# Clock period of the running test in microseconds, recorded by start_clock()
+clock_period_us = None
+
+async def start_clock(dut, period_us):
+    """Start the clock on dut.clk with the given period in microseconds.
+
+    With +cocotb_clkgen the clock generator in tb.v drives clk and only its
+    period is set from here, otherwise a cocotb Clock is started (cocotb
+    kills it again when the test ends). The period is recorded for settle()
+    and count_edges().
+    """
+    global clock_period_us
+    clock_period_us = period_us
+    
+    if cocotb.plusargs.get("cocotb_clkgen", "0") != "0":
+        dut.clk_half_period.value = int(period_us * 500)
+        # The new half period takes effect from the next edge onwards
+        await Edge(dut.clk)
+    else:
+        cocotb.start_soon(Clock(dut.clk, period_us, units="us").start())
+
+async def setup_dut(dut, period_us, reset_cycles=5):
+    """Start the clock and hold the DUT in reset with all inputs cleared."""
+    await start_clock(dut, period_us)
+    
+    dut._log.info("Reset")
+    # Nothing samples these before the reset cycles below, so write them immediately
+    dut.ena.setimmediatevalue(1)
+    dut.ui_in.setimmediatevalue(0)
+    dut.uio_in.setimmediatevalue(0)
+    dut.rst_n.setimmediatevalue(0)
+    await ClockCycles(dut.clk, reset_cycles)
+    dut.rst_n.value = 1
+
+async def settle(dut, cycles):
+    """Let the given number of clock cycles pass and return on a rising edge, like ClockCycles.
+
+    The bulk of the wait is one Timer from a falling edge to a falling edge, so it
+    never expires in the same time step as a rising edge of clk.
+    """
+    await FallingEdge(dut.clk)
+    await Timer((cycles - 1) * clock_period_us, units="us")
+    await RisingEdge(dut.clk)
+
+async def led_toggles(dut, cycles):
+    """Sample the LED for up to the given number of cycles, return True once both levels were seen."""
+    any_low = any_high = False
+    for _ in range(cycles):
+        await RisingEdge(dut.clk)
+        led = int(dut.uo_out.value) & 0x01
+        any_low |= led == 0
+        any_high |= led == 1
+        if any_low and any_high:
+            return True
+    return False
+
+async def count_edges(signal, cycles):
+    """Count the value changes of signal during the given number of clock cycles."""
+    edges = 0
+
+    async def watch():
+        nonlocal edges
+        while True:
+            await Edge(signal)
+            edges += 1
+
+    watcher = cocotb.start_soon(watch())
+    await Timer(cycles * clock_period_us, units="us")
+    watcher.kill()
+    return edges
 
 @cocotb.test()
 async def test_fibo_blink_basic(dut):
@@ -11,28 +106,19 @@ async def test_fibo_blink_basic(dut):
     
     dut._log.info("Start FiboBlink basic test")
     
-    # Set the clock period to 10 us (100 KHz) for visible timing
-    clock = Clock(dut.clk, 10, units="us")
-    cocotb.start_soon(clock.start())
-    
-    # Reset
-    dut._log.info("Reset")
-    dut.ena.value = 1
-    dut.ui_in.value = 0
-    dut.uio_in.value = 0
-    dut.rst_n.value = 0
-    await ClockCycles(dut.clk, 10)
-    dut.rst_n.value = 1
+    # Set the clock period to 10 us (100 KHz) for visible timing, then reset
+    await setup_dut(dut, 10, reset_cycles=10)
     
     dut._log.info("Test FiboBlink default behavior")
     
     # Enable output and select Fibonacci sequence
     dut.ui_in.value = 0x40  # Enable output (bit 6) + Fibonacci sequence (bits 1:0 = 00)
-    await ClockCycles(dut.clk, 20)
+    await settle(dut, 20)
     
     # Check that LED output is active
-    led_output = dut.uo_out.value & 0x01
-    sequence_active = (dut.uo_out.value >> 2) & 0x01
+    uo = int(dut.uo_out.value)
+    led_output = uo & 0x01
+    sequence_active = (uo >> 2) & 0x01
     
     assert sequence_active == 1, f"Expected sequence active, got {sequence_active}"
     dut._log.info("✓ Basic FiboBlink activity test passed")
@@ -43,143 +129,90 @@ async def test_fibonacci_sequence_generation(dut):
     
     dut._log.info("Start Fibonacci sequence generation test")
     
-    # Set up clock
-    clock = Clock(dut.clk, 1, units="us")  # Faster clock for testing
-    cocotb.start_soon(clock.start())
-    
-    # Reset
-    dut.ena.value = 1
-    dut.rst_n.value = 0
-    await ClockCycles(dut.clk, 5)
-    dut.rst_n.value = 1
+    # Set up clock and reset
+    period_us = 1  # Faster clock for testing
+    await setup_dut(dut, period_us)
     
     # Configure: Fibonacci sequence + fastest speed + enable output
     dut.ui_in.value = 0x7C  # Enable(6) + Speed(111) + Fibonacci(00)
-    await ClockCycles(dut.clk, 10)
+    await settle(dut, 10)
     
     # Expected Fibonacci sequence: 1, 1, 2, 3, 5, 8, 13, 21...
     expected_fibonacci = [1, 1, 2, 3, 5, 8, 13, 21, 34, 55]
     
     for i, expected_value in enumerate(expected_fibonacci[:5]):  # Test first 5 numbers
-        # Wait for new number pulse
-        for _ in range(1000):  # Timeout after 1000 cycles
-            await RisingEdge(dut.clk)
-            new_number_pulse = (dut.uo_out.value >> 3) & 0x01
-            if new_number_pulse == 1:
-                break
+        # Wait for new number pulse, timeout after 1000 cycles
+        if dut.new_number_pulse.value != 1:
+            try:
+                await with_timeout(RisingEdge(dut.new_number_pulse), 1000 * period_us, "us")
+            except SimTimeoutError:
+                raise AssertionError(f"Fibonacci[{i}]: No new number pulse within 1000 cycles") from None
         
-        # Read current number (16-bit: upper 8 from uio_out, lower 4 from uo_out[7:4])
-        upper_bits = dut.uio_out.value & 0xFF
-        lower_bits = (dut.uo_out.value >> 4) & 0x0F
-        current_number = (upper_bits << 4) | lower_bits
+        # Read current number: uo_out[7:4] carries bits 3:0, uio_out carries bits 15:8 and
+        # bits 7:4 aren't on the outputs, so only the lower bits can be checked
+        current_number = (int(dut.uo_out.value) >> 4) & 0x0F
         
-        # For small Fibonacci numbers, only check lower bits
-        if expected_value <= 15:
-            current_number = lower_bits
+        if dut._log.isEnabledFor(logging.DEBUG):
+            dut._log.debug(f"Fibonacci[{i}]: Expected {expected_value}, Got {current_number}")
         
-        dut._log.info(f"Fibonacci[{i}]: Expected {expected_value}, Got {current_number}")
+        assert current_number == expected_value, \
+            f"Fibonacci[{i}]: Expected {expected_value}, got {current_number}"
         
-        # Allow some tolerance for timing variations
-        if expected_value <= 15:
-            assert current_number == expected_value, \
-                f"Fibonacci[{i}]: Expected {expected_value}, got {current_number}"
-        
-        await ClockCycles(dut.clk, 10)  # Wait before next number
+        await settle(dut, 10)  # Wait before next number
     
     dut._log.info("✓ Fibonacci sequence generation test passed")
 
-@cocotb.test()
-async def test_sequence_selection(dut):
-    """Test different mathematical sequence selection"""
+async def check_sequence_selection(dut, seq_select, seq_name):
+    """Test mathematical sequence selection"""
     
-    dut._log.info("Start sequence selection test")
+    dut._log.info(f"Start sequence selection test: {seq_name}")
     
-    # Set up clock
-    clock = Clock(dut.clk, 1, units="us")
-    cocotb.start_soon(clock.start())
+    # Set up clock and reset
+    await setup_dut(dut, 1)
     
-    # Reset
-    dut.ena.value = 1
-    dut.rst_n.value = 0
-    await ClockCycles(dut.clk, 5)
-    dut.rst_n.value = 1
+    # Set sequence selection + enable output + medium speed
+    dut.ui_in.value = UI_IN_ENABLED[(0b011, seq_select)]  # Enable + Speed + Sequence
+    await settle(dut, 20)
     
-    # Test different sequence selections
-    sequences = [
-        (0b00, "Fibonacci"),
-        (0b01, "Prime"),
-        (0b10, "Perfect Square"),
-        (0b11, "Triangular")
-    ]
+    # Check that sequence is active
+    sequence_active = (int(dut.uo_out.value) >> 2) & 0x01
+    assert sequence_active == 1, f"{seq_name} sequence not active"
     
-    for seq_select, seq_name in sequences:
-        dut._log.info(f"Testing {seq_name} sequence")
-        
-        # Set sequence selection + enable output + medium speed
-        dut.ui_in.value = 0x40 | (0b011 << 2) | seq_select  # Enable + Speed + Sequence
-        await ClockCycles(dut.clk, 20)
-        
-        # Check that sequence is active
-        sequence_active = (dut.uo_out.value >> 2) & 0x01
-        assert sequence_active == 1, f"{seq_name} sequence not active"
-        
-        # Check that we get some output activity
-        led_states = []
-        for _ in range(100):
-            await RisingEdge(dut.clk)
-            led_states.append(dut.uo_out.value & 0x01)
-        
-        # Should have some variation in LED states
-        unique_states = set(led_states)
-        assert len(unique_states) > 1, f"{seq_name} sequence shows no LED activity"
-        
-        dut._log.info(f"✓ {seq_name} sequence test passed")
+    # Check that we get some output activity: the LED should show both states
+    assert await led_toggles(dut, 100), f"{seq_name} sequence shows no LED activity"
+    
+    dut._log.info(f"✓ {seq_name} sequence test passed")
 
-@cocotb.test()
-async def test_speed_control(dut):
+# One test per sequence, so each starts from reset and can run in its own simulator
+for seq_select, seq_name in SEQUENCES:
+    add_test(sequence_test_name(seq_name), check_sequence_selection, seq_select, seq_name)
+
+async def check_speed_control(dut, speed, speed_name):
     """Test PWM speed control functionality"""
     
-    dut._log.info("Start speed control test")
+    dut._log.info(f"Start speed control test: {speed_name}")
     
-    # Set up clock
-    clock = Clock(dut.clk, 1, units="us")
-    cocotb.start_soon(clock.start())
+    # Set up clock and reset
+    await setup_dut(dut, 1)
     
-    # Reset
-    dut.ena.value = 1
-    dut.rst_n.value = 0
-    await ClockCycles(dut.clk, 5)
-    dut.rst_n.value = 1
+    # Set speed + Fibonacci sequence + enable output
+    dut.ui_in.value = UI_IN_ENABLED[(speed, 0b00)]  # Enable + Speed + Fibonacci
+    await settle(dut, 20)
     
-    # Test different speed settings
-    speeds = [0b000, 0b011, 0b111]  # Slowest, medium, fastest
-    speed_names = ["Slowest", "Medium", "Fastest"]
+    # Monitor timing tick activity over 200 cycles
+    tick_changes = await count_edges(dut.timing_tick, 200)
     
-    for speed, speed_name in zip(speeds, speed_names):
-        dut._log.info(f"Testing {speed_name} speed")
-        
-        # Set speed + Fibonacci sequence + enable output
-        dut.ui_in.value = 0x40 | (speed << 2) | 0b00  # Enable + Speed + Fibonacci
-        await ClockCycles(dut.clk, 20)
-        
-        # Monitor timing tick activity
-        tick_changes = 0
-        prev_tick = (dut.uo_out.value >> 1) & 0x01
-        
-        for _ in range(200):
-            await RisingEdge(dut.clk)
-            current_tick = (dut.uo_out.value >> 1) & 0x01
-            if current_tick != prev_tick:
-                tick_changes += 1
-            prev_tick = current_tick
-        
-        dut._log.info(f"{speed_name} speed: {tick_changes} timing tick changes")
-        
-        # Faster speeds should have more tick changes
-        if speed == 0b111:  # Fastest
-            assert tick_changes > 10, f"Fastest speed should have more activity, got {tick_changes}"
-        
-        dut._log.info(f"✓ {speed_name} speed test passed")
+    dut._log.info(f"{speed_name} speed: {tick_changes} timing tick changes")
+    
+    # Faster speeds should have more tick changes
+    if speed == 0b111:  # Fastest
+        assert tick_changes > 10, f"Fastest speed should have more activity, got {tick_changes}"
+    
+    dut._log.info(f"✓ {speed_name} speed test passed")
+
+# One test per speed setting: slowest, medium, fastest
+for speed, speed_name in SPEEDS:
+    add_test(speed_test_name(speed_name), check_speed_control, speed, speed_name)
 
 @cocotb.test()
 async def test_sequence_reset(dut):
@@ -187,26 +220,19 @@ async def test_sequence_reset(dut):
     
     dut._log.info("Start sequence reset test")
     
-    # Set up clock
-    clock = Clock(dut.clk, 1, units="us")
-    cocotb.start_soon(clock.start())
-    
-    # Reset
-    dut.ena.value = 1
-    dut.rst_n.value = 0
-    await ClockCycles(dut.clk, 5)
-    dut.rst_n.value = 1
+    # Set up clock and reset
+    await setup_dut(dut, 1)
     
     # Start Fibonacci sequence
     dut.ui_in.value = 0x7C  # Enable + Fastest speed + Fibonacci
-    await ClockCycles(dut.clk, 100)  # Let it run for a while
+    await settle(dut, 100)  # Let it run for a while
     
-    # Read current number before reset
-    upper_before = dut.uio_out.value & 0xFF
-    lower_before = (dut.uo_out.value >> 4) & 0x0F
-    number_before = (upper_before << 4) | lower_before
+    # Read current number before reset (uio_out carries bits 15:8, uo_out[7:4] bits 3:0;
+    # bits 7:4 aren't on the outputs)
+    upper_before = int(dut.uio_out.value) & 0xFF
+    lower_before = (int(dut.uo_out.value) >> 4) & 0x0F
     
-    dut._log.info(f"Number before reset: {number_before}")
+    dut._log.info(f"Number before reset: bits 15:8 = {upper_before:#04x}, bits 3:0 = {lower_before:#x}")
     
     # Apply sequence reset
     dut.ui_in.value = 0x7C | (1 << 5)  # Set reset sequence bit
@@ -214,12 +240,10 @@ async def test_sequence_reset(dut):
     
     # Release reset
     dut.ui_in.value = 0x7C  # Clear reset sequence bit
-    await ClockCycles(dut.clk, 20)
+    await settle(dut, 20)
     
     # Read number after reset
-    upper_after = dut.uio_out.value & 0xFF
-    lower_after = (dut.uo_out.value >> 4) & 0x0F
-    number_after = lower_after  # Should be back to first Fibonacci number
+    number_after = (int(dut.uo_out.value) >> 4) & 0x0F  # Should be back to first Fibonacci number
     
     dut._log.info(f"Number after reset: {number_after}")
     
@@ -234,38 +258,29 @@ async def test_led_timing_pattern(dut):
     
     dut._log.info("Start LED timing pattern test")
     
-    # Set up slower clock for visible timing
-    clock = Clock(dut.clk, 100, units="us")
-    cocotb.start_soon(clock.start())
-    
-    # Reset
-    dut.ena.value = 1
-    dut.rst_n.value = 0
-    await ClockCycles(dut.clk, 5)
-    dut.rst_n.value = 1
+    # Set up clock and reset (the transitions are counted in cycles, so the period doesn't matter)
+    period_us = 1
+    await setup_dut(dut, period_us)
     
     # Configure for medium speed Fibonacci with LED enabled
     dut.ui_in.value = 0x4C  # Enable + Medium speed + Fibonacci
-    await ClockCycles(dut.clk, 10)
+    await settle(dut, 10)
     
     # Monitor LED transitions
     led_transitions = []
-    prev_led = dut.uo_out.value & 0x01
-    transition_count = 0
-    
-    for cycle in range(500):  # Monitor for many cycles
-        await RisingEdge(dut.clk)
-        current_led = dut.uo_out.value & 0x01
+    cycle_steps = get_sim_steps(period_us, "us")
+    start_time = get_sim_time("step")
+    end_time = start_time + 500 * cycle_steps  # Monitor for many cycles
+    
+    while len(led_transitions) < 6:  # Collect several transitions
+        try:
+            await with_timeout(Edge(dut.led), end_time - get_sim_time("step"))
+        except SimTimeoutError:
+            break
         
-        if current_led != prev_led:
-            led_transitions.append(cycle)
-            transition_count += 1
-            dut._log.info(f"LED transition {transition_count} at cycle {cycle}")
-            
-            if transition_count >= 6:  # Collect several transitions
-                break
-                
-        prev_led = current_led
+        led_transitions.append((get_sim_time("step") - start_time) // cycle_steps)
+    
+    dut._log.info(f"LED transitions at cycles: {led_transitions}")
     
     # Verify we got LED transitions
     assert len(led_transitions) >= 4, f"Expected multiple LED transitions, got {len(led_transitions)}"
@@ -278,35 +293,22 @@ async def test_output_enable_disable(dut):
     
     dut._log.info("Start output enable/disable test")
     
-    # Set up clock
-    clock = Clock(dut.clk, 10, units="us")
-    cocotb.start_soon(clock.start())
-    
-    # Reset
-    dut.ena.value = 1
-    dut.rst_n.value = 0
-    await ClockCycles(dut.clk, 5)
-    dut.rst_n.value = 1
+    # Set up clock and reset
+    await setup_dut(dut, 10)
     
     # Test with output disabled
     dut.ui_in.value = 0x0C  # Disable output + Medium speed + Fibonacci
-    await ClockCycles(dut.clk, 50)
+    await settle(dut, 50)
     
-    led_output_disabled = dut.uo_out.value & 0x01
+    led_output_disabled = int(dut.uo_out.value) & 0x01
     dut._log.info(f"LED output when disabled: {led_output_disabled}")
     
     # Test with output enabled
     dut.ui_in.value = 0x4C  # Enable output + Medium speed + Fibonacci
-    await ClockCycles(dut.clk, 50)
+    await settle(dut, 50)
     
     # Should see some activity when enabled
-    led_states = []
-    for _ in range(100):
-        await RisingEdge(dut.clk)
-        led_states.append(dut.uo_out.value & 0x01)
-    
-    unique_states = set(led_states)
-    assert len(unique_states) > 1, "Expected LED activity when enabled"
+    assert await led_toggles(dut, 100), "Expected LED activity when enabled"
     
     dut._log.info("✓ Output enable/disable test passed")
 
@@ -316,32 +318,26 @@ async def test_mathematical_accuracy(dut):
     
     dut._log.info("Start mathematical accuracy test")
     
-    # Set up clock
-    clock = Clock(dut.clk, 1, units="us")
-    cocotb.start_soon(clock.start())
-    
-    # Reset
-    dut.ena.value = 1
-    dut.rst_n.value = 0
-    await ClockCycles(dut.clk, 5)
-    dut.rst_n.value = 1
+    # Set up clock and reset
+    await setup_dut(dut, 1)
     
     # Test Perfect Squares sequence (easier to verify)
     dut.ui_in.value = 0x7E  # Enable + Fastest + Perfect Squares (10)
-    await ClockCycles(dut.clk, 20)
+    await settle(dut, 20)
     
     # Expected perfect squares: 1, 4, 9, 16, 25...
     expected_squares = [1, 4, 9, 16]
     
     for i, expected in enumerate(expected_squares):
         # Wait for sequence to advance
-        await ClockCycles(dut.clk, 50)
+        await settle(dut, 50)
         
         # Read current number
-        lower_bits = (dut.uo_out.value >> 4) & 0x0F
+        lower_bits = (int(dut.uo_out.value) >> 4) & 0x0F
         
         if expected <= 15:  # Within 4-bit range
-            dut._log.info(f"Square[{i}]: Expected {expected}, Got {lower_bits}")
+            if dut._log.isEnabledFor(logging.DEBUG):
+                dut._log.debug(f"Square[{i}]: Expected {expected}, Got {lower_bits}")
             # Allow some flexibility for timing
             if lower_bits != 0:  # Ignore zero states
                 assert lower_bits <= expected + 1, \
@@ -0,0 +1,69 @@
+# SPDX-FileCopyrightText: © 2024 Tiny Tapeout
+# SPDX-License-Identifier: Apache-2.0
+
+# Runs each cocotb test in test.py as its own simulator process, so they can
+# be spread over several cores with pytest-xdist: pytest -n 8 test_runner.py
+#
+# Every process compiles its own copy of the design, so this always uses
+# Icarus, where compiling is cheap; a Verilator build per test would cost
+# more than the parallel runs save.
+
+import os
+
+import pytest
+from cocotb_test.simulator import Icarus, run
+
+from testcases import SEQUENCES, SPEEDS, sequence_test_name, speed_test_name
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(TEST_DIR, "..", "src")
+PROJECT_SOURCES = ["project.v"]
+
+TESTCASES = [
+    "test_fibo_blink_basic",
+    "test_fibonacci_sequence_generation",
+    # Generated in test.py, one per sequence / speed setting
+    *(sequence_test_name(seq_name) for _, seq_name in SEQUENCES),
+    *(speed_test_name(speed_name) for _, speed_name in SPEEDS),
+    "test_sequence_reset",
+    "test_led_timing_pattern",
+    "test_output_enable_disable",
+    "test_mathematical_accuracy",
+]
+
+
+@pytest.mark.parametrize("testcase", TESTCASES)
+def test_fibo_blink(testcase):
+    if os.getenv("GATES") != "yes":
+        # RTL simulation:
+        build = "rtl"
+        defines = []
+        verilog_sources = [os.path.join(SRC_DIR, f) for f in PROJECT_SOURCES]
+    else:
+        # Gate level simulation:
+        build = "gl"
+        defines = ["GL_TEST", "FUNCTIONAL", "USE_POWER_PINS", "SIM", "UNIT_DELAY=#1"]
+        libs_ref = os.path.join(os.environ["PDK_ROOT"], "sky130A", "libs.ref", "sky130_fd_sc_hd", "verilog")
+        verilog_sources = [
+            os.path.join(libs_ref, "primitives.v"),
+            os.path.join(libs_ref, "sky130_fd_sc_hd.v"),
+            os.path.join(TEST_DIR, "gate_level_netlist.v"),
+        ]
+
+    plus_args = []
+    if os.getenv("CLKGEN", "1") == "1":
+        plus_args.append("+cocotb_clkgen=1")
+
+    run(
+        simulator=Icarus,
+        verilog_sources=verilog_sources + [os.path.join(TEST_DIR, "tb.v")],
+        includes=[SRC_DIR],
+        defines=defines,
+        toplevel="tb",
+        module="test",
+        testcase=testcase,
+        plus_args=plus_args,
+        python_search=[TEST_DIR],
+        # Separate build directory per test so parallel runs don't collide
+        sim_build=os.path.join(TEST_DIR, "sim_build", build, testcase),
+    )
@@ -0,0 +1,28 @@
+# SPDX-FileCopyrightText: © 2024 Tiny Tapeout
+# SPDX-License-Identifier: Apache-2.0
+
+# Parameters of the generated tests in test.py, shared with test_runner.py
+# so both always agree on which tests exist.
+
+# (ui_in[1:0], name) for each sequence
+SEQUENCES = [
+    (0b00, "Fibonacci"),
+    (0b01, "Prime"),
+    (0b10, "Perfect Square"),
+    (0b11, "Triangular")
+]
+
+# (ui_in[4:2], name) for the speed settings under test
+SPEEDS = [
+    (0b000, "Slowest"),
+    (0b011, "Medium"),
+    (0b111, "Fastest")
+]
+
+def sequence_test_name(seq_name):
+    """Name of the sequence selection test for seq_name, e.g. test_sequence_perfect_square."""
+    return "test_sequence_" + seq_name.lower().replace(" ", "_")
+
+def speed_test_name(speed_name):
+    """Name of the speed control test for speed_name, e.g. test_speed_fastest."""
+    return "test_speed_" + speed_name.lower()